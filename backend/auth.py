@@ -1,9 +1,10 @@
 import os
-from fastapi import Depends, HTTPException, status
+import secrets
+from fastapi import Depends, Header, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 import jwt
 from jwt.exceptions import InvalidTokenError, ExpiredSignatureError
-from typing import Annotated
+from typing import Annotated, Optional
 from datetime import timedelta, timezone, datetime
 from database import SessionDep
 from schemas import TokenData
@@ -59,4 +60,12 @@ def get_current_user(token: Annotated[str, Depends(oauth2_scheme)], session: Ses
     return user
 
 
-CurrentUserDep = Annotated[User, Depends(get_current_user)]
\ No newline at end of file
+CurrentUserDep = Annotated[User, Depends(get_current_user)]
+
+def require_admin(x_admin_token: Annotated[Optional[str], Header()] = None) -> None:
+    admin_token = os.getenv('ADMIN_TOKEN')
+    if not admin_token or not x_admin_token or not secrets.compare_digest(x_admin_token, admin_token):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin access required"
+        )
@@ -0,0 +1,408 @@
+"""
+Load-test and benchmark harness for the API.
+
+Seeds a throwaway database with synthetic users, folder trees and file rows,
+then drives the real FastAPI app with concurrent clients and reports latency
+percentiles and throughput per scenario. Results are written as JSON so runs
+from different commits can be compared with --compare.
+
+Usage:
+    python benchmark.py --users 20 --files 1000000 --output bench.json
+    python benchmark.py --compare bench_main.json --output bench.json
+
+By default the app runs in-process through the Starlette TestClient against a
+SQLite database in a temporary directory. Pass --database-url to seed a
+Postgres stand-in instead, and --base-url to drive a separately started
+uvicorn server pointed at the same database and SECRET_KEY. With --base-url
+the database has to be somewhere the server can find it, so either pass
+--database-url or a --workdir and start the server with
+DATABASE_URL=sqlite:///<workdir>/bench.db. The download blob is stored under
+its absolute path, so the server can run from any directory on the same host.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import secrets
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+
+SCENARIOS = ["upload", "download", "share_link", "listing", "folder_listing", "dashboard"]
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the file management API")
+    parser.add_argument("--database-url", default=None, help="Database to seed (default: temporary SQLite file)")
+    parser.add_argument("--base-url", default=None, help="Drive a running server instead of the in-process app")
+    parser.add_argument("--workdir", default=None, help="Directory for the database and uploads (default: temporary)")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--files", type=int, default=100_000, help="Total synthetic file rows to seed")
+    parser.add_argument("--folder-depth", type=int, default=3)
+    parser.add_argument("--folder-fanout", type=int, default=3)
+    parser.add_argument("--listing-size", type=int, default=5_000, help="Files placed in the folder used for folder_listing")
+    parser.add_argument("--upload-sizes", default="4096,1048576,16777216", help="Comma separated upload sizes in bytes")
+    parser.add_argument("--download-size", type=int, default=8 * 1024 * 1024)
+    parser.add_argument("--requests", type=int, default=200, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--output", default=None, help="Write JSON results to this path")
+    parser.add_argument("--compare", default=None, help="Previous JSON results to diff against")
+    args = parser.parse_args(argv)
+    if args.base_url and not (args.database_url or args.workdir):
+        parser.error("--base-url needs --database-url or --workdir so the server can use the seeded database")
+    return args
+
+
+def configure_environment(args: argparse.Namespace, workdir: str) -> str:
+    """
+    Point the app at the benchmark database before any app module is imported,
+    since database.py creates its engine at import time
+    """
+    os.makedirs(workdir, exist_ok=True)
+    database_url = args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+
+    # Keep SECRET_KEY from .env so tokens are accepted by a server run with --base-url
+    from dotenv import load_dotenv
+    load_dotenv(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env"))
+
+    os.environ["DATABASE_URL"] = database_url
+    os.environ.setdefault("SECRET_KEY", secrets.token_urlsafe(32))
+    os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "600")
+
+    # Uploads are written relative to the working directory
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(workdir)
+    return database_url
+
+
+def write_blob(path: str, size: int) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    chunk = os.urandom(min(size, 1024 * 1024)) if size else b""
+    with open(path, "wb") as buffer:
+        remaining = size
+        while remaining > 0:
+            buffer.write(chunk[:remaining])
+            remaining -= len(chunk)
+
+
+def seed(args: argparse.Namespace) -> Dict:
+    """
+    Seed users, folder trees and file rows, returning the ids the scenarios need
+    """
+    from sqlalchemy import insert
+    from sqlmodel import Session
+    from database import engine, init_db
+    from models import User, Folder, UserFile, FilePermission
+    from utils import get_password_hash
+
+    init_db()
+    started = time.perf_counter()
+
+    # Hashing is deliberately slow, so every synthetic user shares one hash
+    hashed_password = get_password_hash("benchmark")
+    run_id = secrets.token_hex(4)
+
+    with Session(engine) as session:
+        users = [User(email=f"bench-{run_id}-{i}@example.com", password=hashed_password) for i in range(args.users)]
+        session.add_all(users)
+        session.flush()
+        user_ids = [user.id for user in users]
+
+        folders_by_user: Dict[int, List[int]] = {}
+        for user_id in user_ids:
+            level = [None]
+            folder_ids = []
+            for depth in range(args.folder_depth):
+                next_level = []
+                for parent_id in level:
+                    for n in range(args.folder_fanout):
+                        folder = Folder(name=f"folder-{depth}-{n}", owner_id=user_id, parent_id=parent_id)
+                        session.add(folder)
+                        next_level.append(folder)
+                session.flush()
+                level = [folder.id for folder in next_level]
+                folder_ids.extend(level)
+            folders_by_user[user_id] = folder_ids
+        session.commit()
+
+        now = datetime.now(timezone.utc)
+        listing_user = user_ids[0]
+        listing_folder = folders_by_user[listing_user][0] if folders_by_user[listing_user] else None
+
+        def file_row(n: int, owner_id: int, folder_id: Optional[int]) -> Dict:
+            return {
+                "owner_id": owner_id,
+                "folder_id": folder_id,
+                "filesize": 1024 + n % 4096,
+                "filename": f"synthetic_{n}.bin",
+                "filepath": f"uploads/{owner_id}/synthetic_{n}.bin",
+                "upload_date": now,
+                "mime_type": "application/octet-stream",
+                "download_count": 0,
+            }
+
+        batch: List[Dict] = []
+        batch_size = 10_000
+
+        def flush_batch() -> None:
+            if batch:
+                session.execute(insert(UserFile.__table__), batch)
+                batch.clear()
+
+        for n in range(min(args.listing_size, args.files)):
+            batch.append(file_row(n, listing_user, listing_folder))
+            if len(batch) >= batch_size:
+                flush_batch()
+
+        for n in range(args.listing_size, args.files):
+            owner_id = user_ids[n % len(user_ids)]
+            folder_ids = folders_by_user[owner_id]
+            folder_id = folder_ids[n % len(folder_ids)] if folder_ids and n % 5 else None
+            batch.append(file_row(n, owner_id, folder_id))
+            if len(batch) >= batch_size:
+                flush_batch()
+        flush_batch()
+        session.commit()
+
+        # A real file on disk for download and hot share link scenarios. The
+        # path is absolute because a --base-url server has its own working directory.
+        blob_path = os.path.abspath(os.path.join("uploads", str(listing_user), "bench_download.bin"))
+        write_blob(blob_path, args.download_size)
+        blob = UserFile(
+            owner_id=listing_user,
+            filename="bench_download.bin",
+            filepath=blob_path,
+            filesize=args.download_size,
+            upload_date=now,
+            mime_type="application/octet-stream",
+        )
+        session.add(blob)
+        session.flush()
+        share_token = secrets.token_urlsafe(32)
+        session.add(FilePermission(file_id=blob.id, access_type="anyone_with_link", share_token=share_token))
+        session.commit()
+        blob_id = blob.id
+
+    return {
+        "user_ids": user_ids,
+        "listing_user": listing_user,
+        "listing_folder": listing_folder,
+        "download_file": blob_id,
+        "share_token": share_token,
+        "seed_seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+class ClientPool:
+    """One HTTP client per worker thread"""
+
+    def __init__(self, base_url: Optional[str]):
+        self.base_url = base_url
+        self.local = threading.local()
+
+    def get(self):
+        client = getattr(self.local, "client", None)
+        if client is None:
+            if self.base_url:
+                import httpx
+                client = httpx.Client(base_url=self.base_url, timeout=120)
+            else:
+                from fastapi.testclient import TestClient
+                from main import app
+                client = TestClient(app)
+            self.local.client = client
+        return client
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    # Nearest-rank: the smallest value with at least pct% of samples at or below it
+    index = min(len(ordered) - 1, max(0, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def run_scenario(pool: ClientPool, request: Callable, total: int, concurrency: int) -> Dict:
+    """
+    Issue `total` requests across `concurrency` threads. `request(client, n)`
+    returns the response and the number of payload bytes moved.
+    """
+    latencies: List[float] = []
+    errors = 0
+    moved = 0
+    lock = threading.Lock()
+
+    def one(n: int) -> None:
+        nonlocal errors, moved
+        client = pool.get()
+        started = time.perf_counter()
+        response, size = request(client, n)
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            if response.status_code >= 400:
+                errors += 1
+            else:
+                moved += size
+
+    wall_started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, range(total)))
+    wall = time.perf_counter() - wall_started
+
+    return {
+        "requests": total,
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+        "requests_per_s": round(total / wall, 2) if wall else 0.0,
+        "mb_per_s": round(moved / wall / (1024 * 1024), 3) if wall else 0.0,
+    }
+
+
+def build_scenarios(args: argparse.Namespace, seeded: Dict) -> Dict[str, Callable]:
+    from auth import create_access_token
+
+    tokens = {
+        user_id: {"Authorization": f"Bearer {create_access_token({'sub': str(user_id)})}"}
+        for user_id in seeded["user_ids"]
+    }
+    user_ids = seeded["user_ids"]
+    listing_headers = tokens[seeded["listing_user"]]
+    scenarios: Dict[str, Callable] = {}
+
+    for size in [int(s) for s in args.upload_sizes.split(",") if s]:
+        payload = os.urandom(size)
+
+        def upload(client, n, payload=payload, size=size):
+            headers = tokens[user_ids[n % len(user_ids)]]
+            files = {"file": (f"bench_{size}_{n}_{secrets.token_hex(4)}.bin", payload, "application/octet-stream")}
+            return client.post("/files/", headers=headers, files=files), size
+
+        scenarios[f"upload_{size}"] = upload
+
+    def download(client, n):
+        response = client.get(f"/files/{seeded['download_file']}", headers=listing_headers)
+        return response, len(response.content)
+
+    def share_link(client, n):
+        response = client.get(f"/share/{seeded['share_token']}")
+        return response, len(response.content)
+
+    def listing(client, n):
+        response = client.get("/files/", headers=tokens[user_ids[n % len(user_ids)]])
+        return response, len(response.content)
+
+    def folder_listing(client, n):
+        response = client.get(f"/files/{seeded['listing_folder']}/files", headers=listing_headers)
+        return response, len(response.content)
+
+    def dashboard(client, n):
+        response = client.get("/dashboard/dashboard", headers=tokens[user_ids[n % len(user_ids)]])
+        return response, len(response.content)
+
+    scenarios.update({
+        "download": download,
+        "share_link": share_link,
+        "listing": listing,
+        "folder_listing": folder_listing,
+        "dashboard": dashboard,
+    })
+    return scenarios
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL,
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: Dict, baseline_path: str) -> None:
+    with open(baseline_path) as handle:
+        baseline = json.load(handle)
+    print(f"\nCompared with {baseline_path} ({baseline['meta'].get('git_commit')})")
+    print(f"{'scenario':<22}{'p50 Δ%':>10}{'p99 Δ%':>10}{'MB/s Δ%':>10}")
+    for name, result in current["scenarios"].items():
+        before = baseline["scenarios"].get(name)
+        if not before:
+            continue
+
+        def delta(key):
+            return (result[key] - before[key]) / before[key] * 100 if before[key] else 0.0
+
+        print(f"{name:<22}{delta('p50_ms'):>10.1f}{delta('p99_ms'):>10.1f}{delta('mb_per_s'):>10.1f}")
+
+
+def run(args: argparse.Namespace, database_url: str, output: Optional[str], baseline: Optional[str]) -> Dict:
+    seeded = seed(args)
+    print(f"Seeded {args.users} users and {args.files} files in {seeded['seed_seconds']}s")
+
+    pool = ClientPool(args.base_url)
+    selected = [s for s in args.scenarios.split(",") if s]
+    results: Dict[str, Dict] = {}
+    for name, request in build_scenarios(args, seeded).items():
+        if ("upload" if name.startswith("upload_") else name) not in selected:
+            continue
+        results[name] = run_scenario(pool, request, args.requests, args.concurrency)
+        r = results[name]
+        print(f"{name:<22}p50 {r['p50_ms']:>9.2f} ms  p99 {r['p99_ms']:>9.2f} ms  "
+              f"{r['requests_per_s']:>8.1f} req/s  {r['mb_per_s']:>8.2f} MB/s  errors {r['errors']}")
+
+    report = {
+        "meta": {
+            "git_commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "database": database_url.split(":", 1)[0],
+            "params": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+            "seed_seconds": seeded["seed_seconds"],
+        },
+        "scenarios": results,
+    }
+
+    if output:
+        with open(output, "w") as handle:
+            json.dump(report, handle, indent=2)
+        print(f"Results written to {output}")
+    if baseline:
+        compare(report, baseline)
+    return report
+
+
+
+def main(argv: Optional[List[str]] = None) -> Dict:
+    args = parse_args(argv)
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = os.path.abspath(args.compare) if args.compare else None
+    # A temporary workdir holds gigabytes of uploads, so it is removed afterwards
+    temporary_workdir = None if args.workdir else tempfile.mkdtemp(prefix="fms-bench-")
+    started_in = os.getcwd()
+    database_url = configure_environment(args, args.workdir or temporary_workdir)
+    try:
+        return run(args, database_url, output, baseline)
+    finally:
+        if temporary_workdir:
+            from database import engine
+            engine.dispose()
+            os.chdir(started_in)
+            shutil.rmtree(temporary_workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -18,4 +18,35 @@ SessionDep = Annotated[Session, Depends(get_session)]
 
 
 def init_db():
-    SQLModel.metadata.create_all(engine)
\ No newline at end of file
+    SQLModel.metadata.create_all(engine)
+
+    # create_all skips tables that already exist, so add indexes introduced later
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+
+
+def run_migrations_once():
+    """
+    Run init_db once per deployment rather than once per worker. serve.py runs
+    it in the parent and sets DB_INIT_DONE for its workers; other process
+    managers serialize workers on a lock file so schema creation never races.
+    """
+    if os.getenv("DB_INIT_DONE") == "1":
+        return
+
+    # Register every table on the metadata before creating them
+    import models  # noqa: F401
+
+    try:
+        import fcntl
+    except ImportError:
+        init_db()
+        return
+
+    with open(os.getenv("DB_INIT_LOCK", ".db_init.lock"), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            init_db()
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -1,6 +1,8 @@
-from models import User, UserFile, Folder, FilePermission
-from typing import Optional
+from models import User, UserFile, Folder, FilePermission, FileVersion, ChangeCursor, ChangeEvent
+from typing import Optional, List, Tuple
+from datetime import datetime, timezone
 from sqlmodel import Session, select
+from sqlalchemy import delete, func, insert, update
 from exceptions import handle_db_errors
 from utils import verify_password
 
@@ -11,10 +13,72 @@ class DatabaseOperations:
     def __init__(self, session: Session):
         self.session = session
     
+    def _record_change(self, owner_id: int, entity_type: str, entity_id: int, action: str,
+                       name: Optional[str] = None, parent_id: Optional[int] = None,
+                       access_type: Optional[str] = None) -> None:
+        self._record_changes(owner_id, [{
+            "entity_type": entity_type,
+            "entity_id": entity_id,
+            "action": action,
+            "name": name,
+            "parent_id": parent_id,
+            "access_type": access_type
+        }])
+
+    def _record_changes(self, owner_id: int, changes: List[dict]) -> None:
+        """
+        Append to the owner's change log inside the caller's transaction. The
+        cursor row is locked once and moved forward by the number of changes,
+        so sequence numbers follow commit order per user, and the events are
+        written with a single insert however many there are.
+        """
+        if not changes:
+            return
+        locked = select(ChangeCursor).where(ChangeCursor.owner_id == owner_id).with_for_update()
+        cursor = self.session.exec(locked).first()
+        if not cursor:
+            # Users created before the change log existed. FOR UPDATE locks
+            # nothing while the row is missing, so create it in a way that
+            # concurrent requests can't collide on, then take the lock.
+            self._create_change_cursor(owner_id)
+            cursor = self.session.exec(locked).one()
+        first_seq = cursor.seq + 1
+        cursor.seq += len(changes)
+        self.session.add(cursor)
+
+        created_at = datetime.now(timezone.utc)
+        rows = [
+            {
+                "owner_id": owner_id,
+                "seq": first_seq + offset,
+                "created_at": created_at,
+                "name": None,
+                "parent_id": None,
+                "access_type": None,
+                **change
+            }
+            for offset, change in enumerate(changes)
+        ]
+        # render_nulls keeps rows with and without a name in one executemany
+        self.session.exec(insert(ChangeEvent).execution_options(render_nulls=True), params=rows)
+
+    def _create_change_cursor(self, owner_id: int) -> None:
+        if self.session.get_bind().dialect.name == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        self.session.exec(
+            dialect_insert(ChangeCursor)
+            .values(owner_id=owner_id, seq=0)
+            .on_conflict_do_nothing(index_elements=["owner_id"])
+        )
+
     @handle_db_errors("user creation")
     def create_user(self, email: str, hashed_password: str) -> User:
         new_user = User(email=email, password=hashed_password)
         self.session.add(new_user)
+        self.session.flush()
+        self.session.add(ChangeCursor(owner_id=new_user.id, seq=0))
         self.session.commit()
         self.session.refresh(new_user)
         return new_user
@@ -23,6 +87,8 @@ class DatabaseOperations:
     def create_folder(self, name: str, owner_id: int, parent_id: Optional[int] = None) -> Folder:
         new_folder = Folder(name=name, owner_id=owner_id, parent_id=parent_id)
         self.session.add(new_folder)
+        self.session.flush()
+        self._record_change(owner_id, 'folder', new_folder.id, 'create', name=name, parent_id=parent_id)
         self.session.commit()
         self.session.refresh(new_folder)
         return new_folder
@@ -31,35 +97,109 @@ class DatabaseOperations:
     def update_folder(self, folder: Folder, name: str) -> Folder:
         folder.name = name
         self.session.add(folder)
+        self._record_change(folder.owner_id, 'folder', folder.id, 'rename', name=name, parent_id=folder.parent_id)
         self.session.commit()
         self.session.refresh(folder)
         return folder
     
     @handle_db_errors("folder deletion")
     def delete_folder(self, folder: Folder) -> None:
-        self.session.delete(folder)
+        # Delete the whole subtree and move its files to the root explicitly,
+        # rather than relying on foreign key cascades (SQLite doesn't enforce
+        # them by default), and log every folder and file the delete touches
+        subtree = [folder.id]
+        frontier = [folder.id]
+        while frontier:
+            frontier = self.session.exec(select(Folder.id).where(Folder.parent_id.in_(frontier))).all()
+            subtree.extend(frontier)
+        moved_files = self.session.exec(
+            select(UserFile.id, UserFile.filename)
+            .where(UserFile.folder_id.in_(subtree))
+        ).all()
+
+        self._record_changes(
+            folder.owner_id,
+            [{"entity_type": 'folder', "entity_id": folder_id, "action": 'delete'} for folder_id in subtree]
+            + [{"entity_type": 'file', "entity_id": file_id, "action": 'move', "name": filename}
+               for file_id, filename in moved_files]
+        )
+
+        self.session.exec(
+            update(UserFile)
+            .where(UserFile.folder_id.in_(subtree))
+            .values(folder_id=None)
+        )
+        self.session.exec(delete(Folder).where(Folder.id.in_(subtree)))
         self.session.commit()
     
     @handle_db_errors("file upload")
     def upload_file(self, file_data: UserFile) -> UserFile:
         self.session.add(file_data)
-        self.session.commit()
-        self.session.refresh(file_data)
+        self.session.flush()
         
         # Create file permission
         new_permission = FilePermission(file_id=file_data.id)
         self.session.add(new_permission)
+        self._record_change(file_data.owner_id, 'file', file_data.id, 'create',
+                            name=file_data.filename, parent_id=file_data.folder_id)
         self.session.commit()
+        self.session.refresh(file_data)
         return file_data
     
     @handle_db_errors("file deletion")
     def delete_file(self, file: UserFile) -> None:
+        self._record_change(file.owner_id, 'file', file.id, 'delete')
         self.session.delete(file)
         self.session.commit()
     
+    @handle_db_errors("file update")
+    def update_file_content(self, file: UserFile, version: int, archived_path: str, archived_size: int,
+                            new_size: int, max_versions: int) -> List[str]:
+        """
+        Archive the previous content as `version`, point the file at its new
+        content and drop versions beyond `max_versions`. Returns the paths of
+        the dropped versions so the caller can remove them after commit.
+        """
+        self.session.add(FileVersion(
+            file_id=file.id,
+            version=version,
+            filepath=archived_path,
+            filesize=archived_size,
+            created_at=file.upload_date
+        ))
+        file.filesize = new_size
+        file.upload_date = datetime.now(timezone.utc)
+        self.session.add(file)
+        self._record_change(file.owner_id, 'file', file.id, 'update', name=file.filename, parent_id=file.folder_id)
+        self.session.flush()
+
+        stale = self.session.exec(
+            select(FileVersion)
+            .where(FileVersion.file_id == file.id)
+            .order_by(FileVersion.version.desc())
+            .offset(max_versions)
+        ).all()
+        stale_paths = [stale_version.filepath for stale_version in stale]
+        for stale_version in stale:
+            self.session.delete(stale_version)
+        self.session.commit()
+        return stale_paths
+    
+    @handle_db_errors("download count update")
+    def increment_download_count(self, file_id: int) -> None:
+        """Increment in SQL so concurrent downloads don't lose updates"""
+        self.session.exec(
+            update(UserFile)
+            .where(UserFile.id == file_id)
+            .values(download_count=UserFile.download_count + 1)
+        )
+        self.session.commit()
+    
     @handle_db_errors("permission update")
     def update_file_permission(self, permission: FilePermission) -> FilePermission:
         self.session.add(permission)
+        file = self.session.get(UserFile, permission.file_id)
+        self._record_change(file.owner_id, 'file', file.id, 'share', access_type=permission.access_type)
         self.session.commit()
         self.session.refresh(permission)
         return permission
@@ -74,4 +214,98 @@ class DatabaseOperations:
             
         if not verify_password(password, user.password):
             return None
-        return user
\ No newline at end of file
+        return user
+
+    # Read queries. Each route loads exactly what it serializes through one of
+    # these instead of walking lazy relationships on User or Folder.
+
+    @handle_db_errors("file listing")
+    def get_user_files(self, owner_id: int) -> List[UserFile]:
+        return self.session.exec(
+            select(UserFile)
+            .where(UserFile.owner_id == owner_id)
+            .order_by(UserFile.id)
+        ).all()
+
+    @handle_db_errors("file listing")
+    def get_folder_files(self, folder_id: int, owner_id: int) -> List[UserFile]:
+        return self.session.exec(
+            select(UserFile)
+            .where((UserFile.folder_id == folder_id) & (UserFile.owner_id == owner_id))
+            .order_by(UserFile.id)
+        ).all()
+
+    @handle_db_errors("file lookup")
+    def get_owned_file(self, file_id: int, owner_id: int, for_update: bool = False) -> Optional[UserFile]:
+        statement = select(UserFile).where((UserFile.id == file_id) & (UserFile.owner_id == owner_id))
+        if for_update:
+            statement = statement.with_for_update()
+        return self.session.exec(statement).first()
+
+    @handle_db_errors("version lookup")
+    def get_current_version(self, file_id: int) -> int:
+        """The live content is one past the newest archived version"""
+        latest = self.session.exec(
+            select(func.max(FileVersion.version))
+            .where(FileVersion.file_id == file_id)
+        ).one()
+        return (latest or 0) + 1
+
+    @handle_db_errors("version lookup")
+    def get_file_versions(self, file_id: int) -> List[FileVersion]:
+        return self.session.exec(
+            select(FileVersion)
+            .where(FileVersion.file_id == file_id)
+            .order_by(FileVersion.version.desc())
+        ).all()
+
+    @handle_db_errors("version lookup")
+    def get_file_version(self, file_id: int, version: int) -> Optional[FileVersion]:
+        return self.session.exec(
+            select(FileVersion)
+            .where((FileVersion.file_id == file_id) & (FileVersion.version == version))
+        ).first()
+
+    @handle_db_errors("folder listing")
+    def get_user_folders(self, owner_id: int) -> List:
+        """Project only the columns FolderRead needs"""
+        return self.session.exec(
+            select(Folder.id, Folder.name, Folder.parent_id)
+            .where(Folder.owner_id == owner_id)
+            .order_by(Folder.id)
+        ).all()
+
+    @handle_db_errors("dashboard")
+    def get_dashboard_stats(self, owner_id: int) -> Tuple[int, int, int]:
+        """Return file count, total storage and total downloads in one query"""
+        return self.session.exec(
+            select(
+                func.count(UserFile.id),
+                func.coalesce(func.sum(UserFile.filesize), 0),
+                func.coalesce(func.sum(UserFile.download_count), 0),
+            )
+            .where(UserFile.owner_id == owner_id)
+        ).one()
+
+    @handle_db_errors("share link lookup")
+    def get_shared_file(self, token: str) -> Optional[Tuple[FilePermission, UserFile]]:
+        return self.session.exec(
+            select(FilePermission, UserFile)
+            .join(UserFile, UserFile.id == FilePermission.file_id)
+            .where(FilePermission.share_token == token)
+        ).first()
+
+
+    @handle_db_errors("change feed")
+    def get_changes(self, owner_id: int, cursor: int, limit: int) -> List[ChangeEvent]:
+        return self.session.exec(
+            select(ChangeEvent)
+            .where((ChangeEvent.owner_id == owner_id) & (ChangeEvent.seq > cursor))
+            .order_by(ChangeEvent.seq)
+            .limit(limit)
+        ).all()
+
+    @handle_db_errors("change feed")
+    def get_change_cursor(self, owner_id: int) -> int:
+        cursor = self.session.get(ChangeCursor, owner_id)
+        return cursor.seq if cursor else 0
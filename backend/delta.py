@@ -0,0 +1,183 @@
+"""
+Block-level delta sync, rsync style.
+
+The server splits the current version of a file into fixed-size blocks and
+publishes a signature: a weak rolling checksum (adler32) and a strong hash
+(blake2b) per block. A client slides a window over its new content, rolling
+the weak checksum one byte at a time, and whenever a window matches a block
+it emits a copy instruction instead of the bytes. Everything else is sent as
+literal data. The server rebuilds the new version from its existing blocks
+plus the literals.
+
+Instructions are JSON lists:
+    ["copy", first_block, block_count]
+    ["data", length]        # next `length` bytes of the literal data stream
+"""
+import hashlib
+import zlib
+from typing import BinaryIO, Dict, List, Tuple
+
+
+MOD_ADLER = 65521
+DEFAULT_BLOCK_SIZE = 64 * 1024
+MIN_BLOCK_SIZE = 1024
+MAX_BLOCK_SIZE = 4 * 1024 * 1024
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+class DeltaError(ValueError):
+    """Raised for malformed or inconsistent delta instructions"""
+
+
+def weak_checksum(block: bytes) -> int:
+    return zlib.adler32(block)
+
+
+def strong_checksum(block: bytes) -> str:
+    return hashlib.blake2b(block, digest_size=16).hexdigest()
+
+
+class RollingChecksum:
+    """adler32 over a fixed window that can slide one byte at a time"""
+
+    def __init__(self, window: bytes):
+        self.size = len(window)
+        value = zlib.adler32(window)
+        self.a = value & 0xFFFF
+        self.b = value >> 16
+
+    def roll(self, out_byte: int, in_byte: int) -> int:
+        self.a = (self.a - out_byte + in_byte) % MOD_ADLER
+        self.b = (self.b - self.size * out_byte + self.a - 1) % MOD_ADLER
+        return self.digest()
+
+    def digest(self) -> int:
+        return (self.b << 16) | self.a
+
+
+def compute_signature(stream: BinaryIO, block_size: int) -> List[Tuple[int, str]]:
+    """Return (weak, strong) checksums for each block of `stream`"""
+    blocks = []
+    while True:
+        block = stream.read(block_size)
+        if not block:
+            break
+        blocks.append((weak_checksum(block), strong_checksum(block)))
+    return blocks
+
+
+def compute_delta(signature: List[Tuple[int, str]], block_size: int, base_size: int,
+                  data: bytes) -> Tuple[List[list], bytes]:
+    """
+    Client side: diff `data` against a signature, returning the instructions
+    and the literal bytes to upload
+    """
+    by_weak: Dict[int, List[Tuple[int, str]]] = {}
+    for index, (weak, strong) in enumerate(signature):
+        by_weak.setdefault(weak, []).append((index, strong))
+
+    instructions: List[list] = []
+    literals = bytearray()
+    literal_start = 0
+
+    def match(start: int, end: int, weak: int):
+        for index, strong in by_weak.get(weak, ()):
+            if strong_checksum(data[start:end]) == strong:
+                return index
+        return None
+
+    def emit_copy(index: int) -> None:
+        last = instructions[-1] if instructions else None
+        if last and last[0] == "copy" and last[1] + last[2] == index:
+            last[2] += 1
+        else:
+            instructions.append(["copy", index, 1])
+
+    def flush_literals(end: int) -> None:
+        if end > literal_start:
+            instructions.append(["data", end - literal_start])
+            literals.extend(data[literal_start:end])
+
+    position = 0
+    rolling = RollingChecksum(data[:block_size]) if len(data) >= block_size else None
+    while rolling is not None and position + block_size <= len(data):
+        index = match(position, position + block_size, rolling.digest())
+        if index is not None:
+            flush_literals(position)
+            emit_copy(index)
+            position += block_size
+            literal_start = position
+            rolling = RollingChecksum(data[position:position + block_size]) if position + block_size <= len(data) else None
+            continue
+        if position + block_size < len(data):
+            rolling.roll(data[position], data[position + block_size])
+        position += 1
+
+    # The final base block may be shorter than block_size, so try it against the tail
+    last_size = base_size - (len(signature) - 1) * block_size if signature else 0
+    if 0 < last_size < block_size and len(data) - literal_start >= last_size:
+        start = len(data) - last_size
+        last_weak, last_strong = signature[-1]
+        if weak_checksum(data[start:]) == last_weak and strong_checksum(data[start:]) == last_strong:
+            flush_literals(start)
+            emit_copy(len(signature) - 1)
+            literal_start = len(data)
+    flush_literals(len(data))
+    return instructions, bytes(literals)
+
+
+def apply_delta(base: BinaryIO, base_size: int, block_size: int, instructions: List[list],
+                literals: BinaryIO, out: BinaryIO, max_size: int) -> Tuple[int, str]:
+    """
+    Server side: write the new version to `out` from blocks of `base` and the
+    literal stream, refusing to write more than `max_size` bytes. Returns the
+    new size and its sha256.
+    """
+    block_count = (base_size + block_size - 1) // block_size
+    digest = hashlib.sha256()
+    written = 0
+
+    def write(chunk: bytes) -> None:
+        nonlocal written
+        if written + len(chunk) > max_size:
+            raise DeltaError(f"Rebuilt file would exceed {max_size} bytes")
+        out.write(chunk)
+        digest.update(chunk)
+        written += len(chunk)
+
+    for instruction in instructions:
+        if not isinstance(instruction, list) or not instruction:
+            raise DeltaError("Malformed instruction")
+        op = instruction[0]
+
+        if op == "copy" and len(instruction) == 3:
+            first, count = instruction[1], instruction[2]
+            if not (isinstance(first, int) and isinstance(count, int)) or first < 0 or count < 1 \
+                    or first + count > block_count:
+                raise DeltaError(f"Copy of blocks {first}+{count} is outside the base file")
+            base.seek(first * block_size)
+            remaining = min(count * block_size, base_size - first * block_size)
+            while remaining > 0:
+                chunk = base.read(min(COPY_CHUNK_SIZE, remaining))
+                if not chunk:
+                    raise DeltaError("Base file changed while applying delta")
+                write(chunk)
+                remaining -= len(chunk)
+
+        elif op == "data" and len(instruction) == 2:
+            length = instruction[1]
+            if not isinstance(length, int) or length < 1:
+                raise DeltaError("Literal length must be a positive integer")
+            while length > 0:
+                chunk = literals.read(min(COPY_CHUNK_SIZE, length))
+                if not chunk:
+                    raise DeltaError("Literal data is shorter than the instructions declare")
+                write(chunk)
+                length -= len(chunk)
+
+        else:
+            raise DeltaError(f"Unknown instruction {op!r}")
+
+    if literals.read(1):
+        raise DeltaError("Literal data is longer than the instructions declare")
+    return written, digest.hexdigest()
@@ -14,6 +14,27 @@ class DatabaseError(HTTPException):
         super().__init__(status_code=status_code, detail=detail)
 
 
+# PostgreSQL reports the constraint name, SQLite the constrained columns
+RETRYABLE_UNIQUE_CONSTRAINTS = ("change_cursors", "uq_change_event_owner_seq", "change_events.owner_id")
+EXISTING_RECORD_MESSAGES = {
+    "uq_folder_name_parent_owner": "Folder with this name already exists",
+    "folders.name": "Folder with this name already exists",
+}
+
+
+def unique_violation_detail(error_msg: str, operation: str) -> str:
+    """
+    Concurrent writers racing on a user's change log can simply retry, any
+    other duplicate is the client's to fix
+    """
+    if any(name in error_msg for name in RETRYABLE_UNIQUE_CONSTRAINTS):
+        return f"Conflicting update during {operation}, please retry"
+    for name, message in EXISTING_RECORD_MESSAGES.items():
+        if name in error_msg:
+            return message
+    return f"A record with these values already exists ({operation})"
+
+
 def handle_database_error(e: SQLAlchemyError, operation: str) -> None:
     """
     Extract specific error and raise appropriate exception
@@ -29,6 +50,10 @@ def handle_database_error(e: SQLAlchemyError, operation: str) -> None:
                     status_code=status.HTTP_409_CONFLICT,
                     detail="User with this email already exists"
                 )
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=unique_violation_detail(error_msg, operation)
+            )
         
         elif 'foreign key constraint' in error_msg:
             raise HTTPException(
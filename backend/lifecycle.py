@@ -0,0 +1,94 @@
+"""
+Process lifecycle: startup, readiness and graceful shutdown.
+
+The lifespan runs database migrations once per deployment and marks the
+process ready. Draining starts when the server receives its exit signal
+(see serve.py): from then on readiness fails, new uploads are refused and
+change streams close, while uvicorn waits up to its graceful shutdown timeout
+for in-flight requests. The lifespan shutdown then runs the registered hooks.
+"""
+import inspect
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Callable, List
+
+from fastapi import FastAPI, HTTPException, status
+
+
+logger = logging.getLogger()
+
+# Fallback when the kernel can't tell us when the process started
+IMPORTED = time.perf_counter()
+
+
+def process_uptime() -> float:
+    """
+    Seconds since this process was started, read from /proc so that
+    interpreter start-up and imports are included. Elsewhere it falls back
+    to the time since this module was imported.
+    """
+    try:
+        with open("/proc/self/stat") as stat:
+            # The command name may contain spaces, so split after its closing paren
+            fields = stat.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime") as uptime:
+            system_uptime = float(uptime.read().split()[0])
+        return system_uptime - int(fields[19]) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return time.perf_counter() - IMPORTED
+
+
+class LifecycleState:
+    def __init__(self):
+        self.ready = False
+        self.draining = False
+        self.startup_seconds = None
+        self.shutdown_hooks: List[Callable] = []
+
+
+state = LifecycleState()
+
+
+def on_shutdown(hook: Callable) -> Callable:
+    """Register a function or coroutine function to run at lifespan shutdown"""
+    state.shutdown_hooks.append(hook)
+    return hook
+
+
+def begin_draining() -> None:
+    """Called from the server's exit signal handler, before connections drain"""
+    state.ready = False
+    state.draining = True
+
+
+def ensure_accepting_uploads() -> None:
+    """Refuse new uploads once draining so the remaining ones can finish"""
+    if state.draining:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is shutting down, please retry"
+        )
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    from database import run_migrations_once
+
+    run_migrations_once()
+    state.startup_seconds = round(process_uptime(), 2)
+    state.ready = True
+    logger.info(f"Worker {os.getpid()} ready in {state.startup_seconds}s")
+
+    yield
+
+    # uvicorn has already waited for in-flight requests by the time we get here
+    begin_draining()
+    for hook in state.shutdown_hooks:
+        try:
+            result = hook()
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            logger.error(f"Shutdown hook {getattr(hook, '__name__', hook)} failed: {str(e)}")
@@ -1,16 +1,16 @@
-from fastapi import FastAPI, APIRouter
+import lifecycle
+from fastapi import FastAPI, APIRouter, Depends
 
-from database import init_db
-from dotenv import load_dotenv
+from database import engine
 
-from routers import auth, folders, files, sharing, dashboard
+from routers import auth, folders, files, sharing, dashboard, changes, admin, health
+from auth import require_admin
+import profiling
+import query_audit
+import rate_limit
 
-app = FastAPI()
-
-load_dotenv()
-
-# Create tables in the database
-init_db()
+# Schema creation runs once in the lifespan rather than at import in every worker
+app = FastAPI(lifespan=lifecycle.lifespan)
 
 
 app.include_router(auth.router, prefix="/auth", tags=["Authentication"])
@@ -18,6 +18,23 @@ app.include_router(folders.router, prefix="/folders", tags=["Folders"])
 app.include_router(files.router, prefix="/files", tags=["Files"])
 app.include_router(sharing.router, prefix="/share", tags=["File Sharing"])
 app.include_router(dashboard.router, prefix="/dashboard", tags=["Dashboard"])
+app.include_router(changes.router, prefix="/changes", tags=["Change Feed"])
+app.include_router(admin.router, prefix="/admin", tags=["Admin"], dependencies=[Depends(require_admin)])
+app.include_router(health.router, prefix="/health", tags=["Health"])
+
+# Request profiling is opt-in and adds nothing to the request path when disabled
+if profiling.is_enabled():
+    profiling.install(app, engine)
+
+# Test mode that fails requests issuing more SQL statements than QUERY_BUDGET
+if query_audit.is_enabled():
+    query_audit.install(app, engine)
+
+# Added last so it is the outermost middleware and rejects before anything else runs
+if rate_limit.is_enabled():
+    lifecycle.on_shutdown(rate_limit.install(app).close)
+
+lifecycle.on_shutdown(engine.dispose)
 
 
 router = APIRouter()
@@ -10,15 +10,23 @@ class User(SQLModel, table=True):
     email: str = Field(sa_column=Column(Text, unique=True, nullable=False))
     password: str
 
-    files: List["UserFile"] = Relationship(back_populates="user")
-    folders: List["Folder"] = Relationship(back_populates="user")
+    # These collections can hold millions of rows, so they are never lazy loaded;
+    # query them through DatabaseOperations instead
+    files: List["UserFile"] = Relationship(
+        back_populates="user",
+        sa_relationship_kwargs={"lazy": "raise_on_sql", "passive_deletes": True}
+    )
+    folders: List["Folder"] = Relationship(
+        back_populates="user",
+        sa_relationship_kwargs={"lazy": "raise_on_sql", "passive_deletes": True}
+    )
 
 
 class UserFile(SQLModel, table=True):
     __tablename__ = "files"
     id: int = Field(default=None, primary_key=True)
-    owner_id: int = Field(sa_column=Column(ForeignKey("users.id", ondelete="SET NULL"), nullable=False))
-    folder_id: Optional[int] = Field(sa_column=Column(ForeignKey("folders.id", ondelete="SET NULL"), nullable=True))
+    owner_id: int = Field(sa_column=Column(ForeignKey("users.id", ondelete="SET NULL"), nullable=False, index=True))
+    folder_id: Optional[int] = Field(sa_column=Column(ForeignKey("folders.id", ondelete="SET NULL"), nullable=True, index=True))
     filesize: int
     filename: str
     filepath: str
@@ -28,6 +36,10 @@ class UserFile(SQLModel, table=True):
 
     user: User = Relationship(back_populates="files")
     folder: Optional["Folder"] = Relationship(back_populates="files")
+    versions: List["FileVersion"] = Relationship(
+        back_populates="file",
+        sa_relationship_kwargs={"cascade": "all, delete-orphan"}
+    )
 
 
 class Folder(SQLModel, table=True):
@@ -38,18 +50,21 @@ class Folder(SQLModel, table=True):
 
     id: int = Field(default=None, primary_key=True)
     owner_id: int = Field(
-        sa_column=Column(ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+        sa_column=Column(ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
     )
     name: str = Field(sa_column=Column(Text, nullable=False))
     created_at: datetime = Field(
         default_factory=lambda: datetime.now(timezone.utc),
         sa_column=Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     )
-    parent_id: Optional[int] = Field(default=None, sa_column=Column(ForeignKey("folders.id", ondelete="CASCADE"), nullable=True))
+    parent_id: Optional[int] = Field(default=None, sa_column=Column(ForeignKey("folders.id", ondelete="CASCADE"), nullable=True, index=True))
 
     user: "User" = Relationship(back_populates="folders")
 
-    files: List["UserFile"] = Relationship(back_populates="folder")
+    files: List["UserFile"] = Relationship(
+        back_populates="folder",
+        sa_relationship_kwargs={"lazy": "raise_on_sql", "passive_deletes": True}
+    )
 
 
 class FilePermission(SQLModel, table=True):
@@ -61,9 +76,66 @@ class FilePermission(SQLModel, table=True):
     access_type: str = Field(
         sa_column=Column(Enum('only_me', 'anyone_with_link', 'timed_access', name='access_type_enum'), server_default='only_me', nullable=False)
     )
-    share_token: Optional[str] = None
+    share_token: Optional[str] = Field(default=None, index=True)
     expiry_time: Optional[datetime] = Field(
         default=None,
         sa_column=Column(DateTime(timezone=True), nullable=True)
     )
 
+
+
+class FileVersion(SQLModel, table=True):
+    """Previous content of a file, archived when a delta update replaces it"""
+    __tablename__ = "file_versions"
+    __table_args__ = (
+        UniqueConstraint("file_id", "version", name="uq_file_version"),
+    )
+
+    id: int = Field(default=None, primary_key=True)
+    file_id: int = Field(
+        sa_column=Column(ForeignKey("files.id", ondelete="CASCADE"), nullable=False)
+    )
+    version: int = Field(nullable=False)
+    filepath: str
+    filesize: int
+    created_at: datetime = Field(
+        sa_column=Column(DateTime(timezone=True), nullable=False)
+    )
+
+    file: UserFile = Relationship(back_populates="versions")
+
+
+class ChangeCursor(SQLModel, table=True):
+    """Last change sequence number handed out for each user"""
+    __tablename__ = "change_cursors"
+    owner_id: int = Field(
+        sa_column=Column(ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    )
+    seq: int = Field(default=0, nullable=False)
+
+
+class ChangeEvent(SQLModel, table=True):
+    __tablename__ = "change_events"
+    __table_args__ = (
+        UniqueConstraint("owner_id", "seq", name="uq_change_event_owner_seq"),
+    )
+
+    id: int = Field(default=None, primary_key=True)
+    owner_id: int = Field(
+        sa_column=Column(ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    )
+    seq: int = Field(nullable=False)
+    entity_type: str = Field(
+        sa_column=Column(Enum('file', 'folder', name='change_entity_enum'), nullable=False)
+    )
+    entity_id: int
+    action: str = Field(
+        sa_column=Column(Enum('create', 'update', 'delete', 'rename', 'move', 'share', name='change_action_enum'), nullable=False)
+    )
+    name: Optional[str] = None
+    parent_id: Optional[int] = None
+    access_type: Optional[str] = None
+    created_at: datetime = Field(
+        default_factory=lambda: datetime.now(timezone.utc),
+        sa_column=Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    )
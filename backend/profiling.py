@@ -0,0 +1,301 @@
+"""
+Opt-in request profiler.
+
+When PROFILING_ENABLED is set, a middleware samples the call stacks of the
+threads serving a request and records every SQL statement it executes. The
+event loop thread is sampled only while it is running this request, and
+threadpool workers only while they run a call made on the request's behalf. A
+request is profiled when it carries an X-Profile header matching ADMIN_TOKEN,
+when it is picked by PROFILE_SAMPLE_RATE, or, when PROFILE_SLOW_MS is set,
+whenever it turns out slower than that threshold. Profiles are stored as JSON
+in a bounded on-disk ring buffer and served by the admin router.
+
+When profiling is disabled nothing is installed, so requests pay nothing.
+"""
+import json
+import logging
+import os
+import random
+import re
+import secrets
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import anyio.to_thread
+from fastapi import FastAPI, Request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+logger = logging.getLogger()
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+PROFILE_ID_PATTERN = re.compile(r"^\d+-[0-9a-f]{8}$")
+MAX_STATEMENT_LENGTH = 2000
+
+_current_profile: ContextVar[Optional["RequestProfile"]] = ContextVar("current_profile", default=None)
+
+
+def is_enabled() -> bool:
+    return os.getenv("PROFILING_ENABLED", "").lower() in ("1", "true", "yes")
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _is_app_frame(frame) -> bool:
+    filename = frame.f_code.co_filename
+    return filename.startswith(APP_DIR) and "site-packages" not in filename
+
+
+def _handles_scope(frame, scope: Dict) -> bool:
+    # Every ASGI callable on a request's call chain takes its scope as an
+    # argument, so the loop thread is serving this request exactly when one
+    # of the frames on its stack holds this scope
+    return "scope" in frame.f_code.co_varnames and frame.f_locals.get("scope") is scope
+
+
+class RequestProfile:
+    """Stack samples and SQL timings collected for a single request"""
+
+    def __init__(self, scope: Dict, forced: bool, sampled: bool):
+        self.id = f"{int(time.time() * 1000)}-{secrets.token_hex(4)}"
+        self.scope = scope
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.forced = forced
+        self.sampled = sampled
+        self.started_at = datetime.now(timezone.utc)
+        self.loop_thread = threading.get_ident()
+        self.worker_threads = set()
+        self.samples: Counter = Counter()
+        self.queries: List[Dict] = []
+        self.lock = threading.Lock()
+
+    def run_in_worker(self, func, *args):
+        """Run `func` in the current threadpool worker, sampling it meanwhile"""
+        thread_id = threading.get_ident()
+        with self.lock:
+            self.worker_threads.add(thread_id)
+        try:
+            return func(*args)
+        finally:
+            with self.lock:
+                self.worker_threads.discard(thread_id)
+
+    def sample(self, frames: Dict) -> None:
+        """
+        Record the stack of the loop thread while it runs this request and of
+        the workers currently running its calls, skipping stacks that are
+        outside application code
+        """
+        with self.lock:
+            thread_ids = [self.loop_thread, *self.worker_threads]
+        for thread_id in thread_ids:
+            frame = frames.get(thread_id)
+            stack = []
+            in_app = False
+            ours = thread_id != self.loop_thread
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                in_app = in_app or _is_app_frame(frame)
+                ours = ours or _handles_scope(frame, self.scope)
+                frame = frame.f_back
+            if in_app and ours:
+                with self.lock:
+                    self.samples[";".join(reversed(stack))] += 1
+
+    def record_query(self, statement: str, duration: float) -> None:
+        with self.lock:
+            self.queries.append({
+                "statement": statement[:MAX_STATEMENT_LENGTH],
+                "duration_ms": round(duration * 1000, 3),
+            })
+
+    def to_dict(self, status_code: int, duration: float, interval: float) -> Dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status_code": status_code,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": round(duration * 1000, 3),
+            "trigger": "header" if self.forced else "sample" if self.sampled else "slow",
+            "sample_interval_ms": interval * 1000,
+            "samples": dict(self.samples.most_common()),
+            "query_count": len(self.queries),
+            "query_time_ms": round(sum(q["duration_ms"] for q in self.queries), 3),
+            "queries": self.queries,
+        }
+
+
+class StackSampler:
+    """Background thread sampling the stacks of every active profile"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.profiles = set()
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def add(self, profile: RequestProfile) -> None:
+        with self.lock:
+            self.profiles.add(profile)
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+                self.thread.start()
+        self.wakeup.set()
+
+    def remove(self, profile: RequestProfile) -> None:
+        with self.lock:
+            self.profiles.discard(profile)
+
+    def _run(self) -> None:
+        while True:
+            self.wakeup.clear()
+            with self.lock:
+                active = list(self.profiles)
+            if not active:
+                self.wakeup.wait()
+                continue
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            for profile in active:
+                profile.sample(frames)
+
+
+class ProfileStore:
+    """Bounded ring buffer of profiles, one JSON file each"""
+
+    def __init__(self, directory: str, max_entries: int):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+
+    def _ids(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        ids = [name[:-5] for name in os.listdir(self.directory) if name.endswith(".json")]
+        return sorted((i for i in ids if PROFILE_ID_PATTERN.match(i)), key=lambda i: int(i.split("-")[0]))
+
+    def save(self, data: Dict) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{data['id']}.json")
+        with open(f"{path}.tmp", "w") as buffer:
+            json.dump(data, buffer)
+        os.replace(f"{path}.tmp", path)
+
+        with self.lock:
+            ids = self._ids()
+            for old_id in ids[:max(0, len(ids) - self.max_entries)]:
+                try:
+                    os.remove(os.path.join(self.directory, f"{old_id}.json"))
+                except FileNotFoundError:
+                    pass
+
+    def get(self, profile_id: str) -> Optional[Dict]:
+        if not PROFILE_ID_PATTERN.match(profile_id):
+            return None
+        try:
+            with open(os.path.join(self.directory, f"{profile_id}.json")) as buffer:
+                return json.load(buffer)
+        except FileNotFoundError:
+            return None
+
+    def list(self) -> List[Dict]:
+        summaries = []
+        for profile_id in reversed(self._ids()):
+            data = self.get(profile_id)
+            if data:
+                summaries.append({
+                    key: data[key]
+                    for key in ("id", "method", "path", "status_code", "started_at", "duration_ms", "trigger", "query_count")
+                })
+        return summaries
+
+
+store = ProfileStore(
+    directory=os.getenv("PROFILE_DIR", "profiles"),
+    max_entries=int(os.getenv("PROFILE_MAX_ENTRIES", "50")),
+)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current_profile.get()
+    if profile is not None:
+        conn.info.setdefault("profile_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current_profile.get()
+    starts = conn.info.get("profile_query_start")
+    if profile is not None and starts:
+        profile.record_query(statement, time.perf_counter() - starts.pop())
+
+
+_run_sync = anyio.to_thread.run_sync
+
+
+async def _profiled_run_sync(func, *args, **kwargs):
+    # FastAPI and starlette hand sync endpoints, dependencies and file I/O to
+    # the threadpool through anyio.to_thread.run_sync
+    profile = _current_profile.get()
+    if profile is None:
+        return await _run_sync(func, *args, **kwargs)
+    return await _run_sync(profile.run_in_worker, func, *args, **kwargs)
+
+
+def install(app: FastAPI, engine: Engine) -> None:
+    """
+    Attach the profiling middleware and SQL listeners to the app
+    """
+    sample_rate = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+    slow_ms = os.getenv("PROFILE_SLOW_MS")
+    slow_threshold = float(slow_ms) / 1000 if slow_ms else None
+    interval = float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000
+    trigger_token = os.getenv("ADMIN_TOKEN")
+    sampler = StackSampler(interval)
+
+    anyio.to_thread.run_sync = _profiled_run_sync
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+    @app.middleware("http")
+    async def profile_requests(request: Request, call_next):
+        header = request.headers.get("X-Profile")
+        forced = bool(trigger_token and header and secrets.compare_digest(header, trigger_token))
+        sampled = not forced and sample_rate > 0 and random.random() < sample_rate
+        if not (forced or sampled or slow_threshold is not None):
+            return await call_next(request)
+
+        profile = RequestProfile(request.scope, forced, sampled)
+        reset_token = _current_profile.set(profile)
+        sampler.add(profile)
+        started = time.perf_counter()
+        status_code = 500
+        try:
+            response = await call_next(request)
+            status_code = response.status_code
+        finally:
+            duration = time.perf_counter() - started
+            sampler.remove(profile)
+            _current_profile.reset(reset_token)
+            keep = forced or sampled or duration >= slow_threshold
+            if keep:
+                try:
+                    store.save(profile.to_dict(status_code, duration, interval))
+                except OSError as e:
+                    logger.error(f"Could not save request profile {profile.id}: {str(e)}")
+                    keep = False
+
+        if keep:
+            response.headers["X-Profile-Id"] = profile.id
+        return response
@@ -0,0 +1,59 @@
+"""
+Per-request SQL query budget.
+
+Setting QUERY_BUDGET turns on a test mode in which every request counts the
+statements it executes. The count is returned in an X-Query-Count header, and
+a request that issues more statements than the budget is answered with a 500
+so N+1 regressions fail loudly in tests instead of only showing up as latency.
+"""
+import logging
+import os
+from contextvars import ContextVar
+from typing import List, Optional
+
+from fastapi import FastAPI, Request, status
+from fastapi.responses import JSONResponse
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+logger = logging.getLogger()
+
+# Holds a one-item list so threadpool copies of the context update the same count
+_query_count: ContextVar[Optional[List[int]]] = ContextVar("query_count", default=None)
+
+
+def is_enabled() -> bool:
+    return bool(os.getenv("QUERY_BUDGET"))
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    counter = _query_count.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+def install(app: FastAPI, engine: Engine) -> None:
+    """
+    Attach the query counter and budget check to the app
+    """
+    budget = int(os.getenv("QUERY_BUDGET"))
+    event.listen(engine, "before_cursor_execute", _count_query)
+
+    @app.middleware("http")
+    async def enforce_query_budget(request: Request, call_next):
+        counter = [0]
+        reset_token = _query_count.set(counter)
+        try:
+            response = await call_next(request)
+        finally:
+            _query_count.reset(reset_token)
+
+        if counter[0] > budget:
+            logger.error(f"{request.method} {request.url.path} issued {counter[0]} queries, budget is {budget}")
+            response = JSONResponse(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                content={"detail": f"Query budget exceeded: {counter[0]} queries (budget {budget})"}
+            )
+        response.headers["X-Query-Count"] = str(counter[0])
+        return response
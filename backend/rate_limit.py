@@ -0,0 +1,248 @@
+"""
+Token-bucket rate limiting and download bandwidth shaping.
+
+Limits are configured as "<requests>/<seconds>" strings:
+
+    RATE_LIMIT_IP            requests per client IP
+    RATE_LIMIT_USER          requests per authenticated user
+    RATE_LIMIT_SHARE_TOKEN   requests per share link token
+    RATE_LIMIT_LOGIN         login attempts per client IP
+
+DOWNLOAD_BYTES_PER_SECOND shapes streamed download bodies per user (or per IP
+for share links), with DOWNLOAD_BURST_BYTES of headroom (default one second).
+
+Buckets live in process memory by default. Set RATE_LIMIT_STORE to
+"module:ClassName" to plug in a shared store for multi-worker deployments;
+the class must implement BucketStore. Users are identified from the JWT
+alone, so rejected requests never touch the database.
+"""
+import asyncio
+import importlib
+import math
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import jwt
+from fastapi import FastAPI
+from jwt.exceptions import InvalidTokenError
+
+from auth import SECRET_KEY, ALGORITHM
+
+
+LIMIT_SETTINGS = {
+    "ip": "RATE_LIMIT_IP",
+    "user": "RATE_LIMIT_USER",
+    "share": "RATE_LIMIT_SHARE_TOKEN",
+    "login": "RATE_LIMIT_LOGIN",
+}
+REJECTION_BODY = b'{"detail":"Too many requests"}'
+
+
+class Limit:
+    """A bucket refilling `rate` tokens per second up to `capacity`"""
+
+    def __init__(self, capacity: float, rate: float):
+        self.capacity = capacity
+        self.rate = rate
+
+    @classmethod
+    def parse(cls, value: str) -> "Limit":
+        requests, seconds = value.split("/")
+        return cls(capacity=float(requests), rate=float(requests) / float(seconds))
+
+
+class BucketStore(ABC):
+    """Interface for token bucket state shared between requests"""
+
+    @abstractmethod
+    async def consume(self, key: str, cost: float, limit: Limit, allow_debt: bool = False) -> float:
+        """
+        Take `cost` tokens from the bucket at `key` and return how many seconds
+        the caller has to wait. Without `allow_debt` nothing is taken when the
+        bucket is short, and a positive return value means rejected. With it the
+        tokens are always taken and the caller sleeps off the deficit.
+        """
+
+    async def close(self) -> None:
+        pass
+
+
+class MemoryStore(BucketStore):
+    """Per-process buckets, evicting the least recently used beyond `max_keys`"""
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self.buckets: "OrderedDict[str, list]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    async def consume(self, key: str, cost: float, limit: Limit, allow_debt: bool = False) -> float:
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = [limit.capacity, now]
+                self.buckets[key] = bucket
+                if len(self.buckets) > self.max_keys:
+                    self.buckets.popitem(last=False)
+            else:
+                self.buckets.move_to_end(key)
+                bucket[0] = min(limit.capacity, bucket[0] + (now - bucket[1]) * limit.rate)
+                bucket[1] = now
+
+            if bucket[0] >= cost:
+                bucket[0] -= cost
+                return 0.0
+            if allow_debt:
+                bucket[0] -= cost
+                return -bucket[0] / limit.rate
+            return (cost - bucket[0]) / limit.rate
+
+
+def load_store() -> BucketStore:
+    path = os.getenv("RATE_LIMIT_STORE")
+    if not path:
+        return MemoryStore(int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000")))
+    module_name, class_name = path.split(":")
+    store_class = getattr(importlib.import_module(module_name), class_name)
+    if not (isinstance(store_class, type) and issubclass(store_class, BucketStore)):
+        raise TypeError(f"RATE_LIMIT_STORE {path} is not a BucketStore subclass")
+    return store_class()
+
+
+def load_limits() -> Dict[str, Limit]:
+    return {name: Limit.parse(os.environ[env]) for name, env in LIMIT_SETTINGS.items() if os.getenv(env)}
+
+
+def load_bandwidth() -> Optional[Limit]:
+    rate = os.getenv("DOWNLOAD_BYTES_PER_SECOND")
+    if not rate:
+        return None
+    burst = os.getenv("DOWNLOAD_BURST_BYTES", rate)
+    return Limit(capacity=float(burst), rate=float(rate))
+
+
+def is_enabled() -> bool:
+    return bool(load_limits() or load_bandwidth())
+
+
+def _user_id(headers: Dict[bytes, bytes]) -> Optional[str]:
+    authorization = headers.get(b"authorization", b"")
+    if not authorization[:7].lower() == b"bearer ":
+        return None
+    try:
+        payload = jwt.decode(authorization[7:].decode(), SECRET_KEY, algorithms=[ALGORITHM])
+    except (InvalidTokenError, UnicodeDecodeError):
+        return None
+    return payload.get("sub")
+
+
+def _is_download(method: str, path: str) -> bool:
+    if method != "GET":
+        return False
+    if path.startswith("/share/"):
+        return True
+    if not path.startswith("/files/"):
+        return False
+    parts = path[len("/files/"):].split("/")
+    # /files/{file_id} and /files/{file_id}/versions/{version}
+    return all(p.isdigit() for p in parts[::2]) and (len(parts) == 1 or (len(parts) == 3 and parts[1] == "versions"))
+
+
+class RateLimitMiddleware:
+    """
+    ASGI middleware applying request limits before routing and shaping
+    download bodies as they are sent
+    """
+
+    def __init__(self, app, store: BucketStore, limits: Dict[str, Limit],
+                 bandwidth: Optional[Limit] = None, trust_proxy: bool = False):
+        self.app = app
+        self.store = store
+        self.limits = limits
+        self.bandwidth = bandwidth
+        self.trust_proxy = trust_proxy
+
+    def _client_ip(self, scope, headers: Dict[bytes, bytes]) -> str:
+        forwarded = headers.get(b"x-forwarded-for")
+        if self.trust_proxy and forwarded:
+            return forwarded.split(b",")[0].strip().decode("latin-1")
+        client = scope.get("client")
+        return client[0] if client else "unknown"
+
+    async def __call__(self, scope, receive, send):
+        # Health probes come from the orchestrator and must never be throttled
+        if scope["type"] != "http" or scope["path"].startswith("/health/"):
+            await self.app(scope, receive, send)
+            return
+
+        method, path = scope["method"], scope["path"]
+        headers = dict(scope["headers"])
+        ip = self._client_ip(scope, headers)
+        user_id = _user_id(headers) if "user" in self.limits or self.bandwidth else None
+
+        checks: Tuple = ()
+        if "ip" in self.limits:
+            checks += ((f"ip:{ip}", self.limits["ip"]),)
+        if "login" in self.limits and method == "POST" and path == "/auth/login":
+            checks += ((f"login:{ip}", self.limits["login"]),)
+        if "user" in self.limits and user_id:
+            checks += ((f"user:{user_id}", self.limits["user"]),)
+        if "share" in self.limits and method == "GET" and path.startswith("/share/"):
+            checks += ((f"share:{path[len('/share/'):]}", self.limits["share"]),)
+
+        for key, limit in checks:
+            wait = await self.store.consume(key, 1, limit)
+            if wait > 0:
+                await self._reject(send, wait)
+                return
+
+        if self.bandwidth and _is_download(method, path):
+            bandwidth_key = f"bandwidth:user:{user_id}" if user_id else f"bandwidth:ip:{ip}"
+            # Bodies sent through pathsend bypass `send`, so force chunked sends
+            extensions = {k: v for k, v in scope.get("extensions", {}).items() if k != "http.response.pathsend"}
+            scope = {**scope, "extensions": extensions}
+            send = self._shaped_send(send, bandwidth_key)
+
+        await self.app(scope, receive, send)
+
+    def _shaped_send(self, send, key: str):
+        async def shaped_send(message):
+            if message["type"] == "http.response.body":
+                size = len(message.get("body", b""))
+                if size:
+                    delay = await self.store.consume(key, size, self.bandwidth, allow_debt=True)
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+            await send(message)
+        return shaped_send
+
+    async def _reject(self, send, wait: float) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(REJECTION_BODY)).encode()),
+                (b"retry-after", str(max(1, math.ceil(wait))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": REJECTION_BODY})
+
+
+def install(app: FastAPI) -> BucketStore:
+    """
+    Add the rate limiting middleware to the app and return its bucket store
+    """
+    store = load_store()
+    app.add_middleware(
+        RateLimitMiddleware,
+        store=store,
+        limits=load_limits(),
+        bandwidth=load_bandwidth(),
+        trust_proxy=os.getenv("RATE_LIMIT_TRUST_PROXY", "").lower() in ("1", "true", "yes"),
+    )
+    return store
@@ -0,0 +1,42 @@
+from fastapi import APIRouter, status, HTTPException
+from fastapi.responses import PlainTextResponse
+from profiling import store
+
+
+router = APIRouter()
+
+
+@router.get("/profiles")
+def list_profiles():
+    """
+    Endpoint to list the captured request profiles, newest first
+    """
+    return store.list()
+
+
+@router.get("/profiles/{profile_id}")
+def get_profile(profile_id: str):
+    """
+    Endpoint to return a captured request profile with its SQL statements
+    """
+    profile = store.get(profile_id)
+    if not profile:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profile not found"
+        )
+    return profile
+
+
+@router.get("/profiles/{profile_id}/collapsed", response_class=PlainTextResponse)
+def get_profile_collapsed(profile_id: str):
+    """
+    Endpoint to return the stack samples in collapsed format for flamegraph tools
+    """
+    profile = store.get(profile_id)
+    if not profile:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profile not found"
+        )
+    return "\n".join(f"{stack} {count}" for stack, count in profile["samples"].items())
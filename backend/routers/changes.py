@@ -0,0 +1,85 @@
+from fastapi import APIRouter, Header, Query, Request
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from sqlmodel import Session
+from typing import Annotated, Optional
+import asyncio
+import os
+import time
+from database import SessionDep, engine
+from auth import CurrentUserDep
+from database_operations import DatabaseOperations
+from schemas import ChangeFeed, ChangeRead
+from lifecycle import state
+
+
+router = APIRouter()
+
+POLL_SECONDS = float(os.getenv("CHANGE_POLL_SECONDS", "1"))
+KEEPALIVE_SECONDS = 15
+MAX_CHANGES = 1000
+
+
+@router.get("/", response_model=ChangeFeed)
+def get_changes(session: SessionDep, current_user: CurrentUserDep,
+                cursor: int = 0, limit: Annotated[int, Query(ge=1, le=MAX_CHANGES)] = 500):
+    """
+    Endpoint to return the user's file and folder changes after `cursor`
+    """
+    db_ops = DatabaseOperations(session)
+    changes = db_ops.get_changes(current_user.id, cursor, limit + 1)
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    return ChangeFeed(
+        changes=[ChangeRead.model_validate(change) for change in changes],
+        cursor=changes[-1].seq if changes else cursor,
+        has_more=has_more
+    )
+
+
+@router.get("/cursor")
+def get_change_cursor(session: SessionDep, current_user: CurrentUserDep):
+    """
+    Endpoint to return the latest cursor, taken before an initial full listing
+    """
+    db_ops = DatabaseOperations(session)
+    return {"cursor": db_ops.get_change_cursor(current_user.id)}
+
+
+def fetch_changes(owner_id: int, cursor: int):
+    with Session(engine) as session:
+        db_ops = DatabaseOperations(session)
+        return [ChangeRead.model_validate(change) for change in db_ops.get_changes(owner_id, cursor, MAX_CHANGES)]
+
+
+@router.get("/stream")
+async def stream_changes(request: Request, current_user: CurrentUserDep, cursor: int = 0,
+                         last_event_id: Annotated[Optional[str], Header()] = None):
+    """
+    Endpoint to stream the user's changes after `cursor` as server-sent events.
+    Reconnecting clients resume from the Last-Event-ID header.
+    """
+    if last_event_id and last_event_id.isdigit():
+        cursor = max(cursor, int(last_event_id))
+    owner_id = current_user.id
+
+    async def events(cursor: int):
+        last_sent = time.monotonic()
+        while not state.draining and not await request.is_disconnected():
+            changes = await run_in_threadpool(fetch_changes, owner_id, cursor)
+            for change in changes:
+                cursor = change.seq
+                yield f"id: {change.seq}\nevent: change\ndata: {change.model_dump_json()}\n\n"
+            if changes:
+                last_sent = time.monotonic()
+                continue
+            if time.monotonic() - last_sent >= KEEPALIVE_SECONDS:
+                last_sent = time.monotonic()
+                yield ": keepalive\n\n"
+            await asyncio.sleep(POLL_SECONDS)
+
+    return StreamingResponse(
+        events(cursor),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
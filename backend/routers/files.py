@@ -1,17 +1,39 @@
-from fastapi import APIRouter, status, HTTPException, UploadFile, File
+from fastapi import APIRouter, status, HTTPException, UploadFile, File, Form, Query
 from fastapi.responses import FileResponse
+import io
+import json
 import os
+import secrets
 import shutil
 from database import SessionDep
 from auth import CurrentUserDep
-from sqlmodel import select
 from models import Folder, UserFile
-from typing import List, Optional
+from schemas import FileSignature, FileVersionRead
+from typing import Annotated, List, Optional
 from datetime import datetime, timezone
 from database_operations import DatabaseOperations
+from lifecycle import ensure_accepting_uploads
+from delta import (
+    DEFAULT_BLOCK_SIZE, MIN_BLOCK_SIZE, MAX_BLOCK_SIZE, DeltaError, apply_delta, compute_signature
+)
 
 router = APIRouter()
 
+# The current version number is derived from the newest archived one, so at
+# least one archive has to be kept
+MAX_FILE_VERSIONS = int(os.getenv("MAX_FILE_VERSIONS", "10"))
+if MAX_FILE_VERSIONS < 1:
+    raise ValueError("MAX_FILE_VERSIONS must be at least 1")
+
+# A delta may rebuild at most this multiple of the base size plus its literals,
+# so a short list of repeated copy instructions cannot fill the disk
+MAX_DELTA_GROWTH = float(os.getenv("MAX_DELTA_GROWTH", "2"))
+
+
+def get_versions_dir(file: UserFile) -> str:
+    """Archived versions and cached signatures live next to the file"""
+    return os.path.join(os.path.dirname(file.filepath), ".versions", str(file.id))
+
 
 @router.post("/", status_code=status.HTTP_200_OK)
 def upload_file(session: SessionDep, current_user: CurrentUserDep, file: UploadFile = File(...), folder_id: Optional[int] = None):
@@ -29,6 +51,8 @@ def upload_file(session: SessionDep, current_user: CurrentUserDep, file: UploadF
     else:
         folder = None
 
+    ensure_accepting_uploads()
+
     # Create a separate dir for each user using their id for uniqueness
     user_dir = os.path.join("uploads", str(current_user.id))
     os.makedirs(user_dir, exist_ok=True)
@@ -58,7 +82,12 @@ def upload_file(session: SessionDep, current_user: CurrentUserDep, file: UploadF
         )
     
     db_ops = DatabaseOperations(session)
-    db_ops.upload_file(new_file)
+    try:
+        db_ops.upload_file(new_file)
+    except HTTPException:
+        # Don't leave a file on disk that no row points to
+        os.remove(file_path)
+        raise
     return {"message": "File uploaded successfully"}
 
 
@@ -67,8 +96,8 @@ def get_files(session: SessionDep, current_user: CurrentUserDep):
     """
     Endpoint to return all the files upload by a user
     """
-    files = current_user.files
-    return files
+    db_ops = DatabaseOperations(session)
+    return db_ops.get_user_files(current_user.id)
 
 
 @router.get("/{folder_id}/files", response_model=List[UserFile])
@@ -77,14 +106,14 @@ def get_files_from_a_folder(folder_id: int, session: SessionDep, current_user: C
     Endpoint to return all the files in a folder
     """
     folder = session.get(Folder, folder_id)
-    if not folder:
+    if not folder or folder.owner_id != current_user.id:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Folder not found"
         )
     
-    files = folder.files
-    return files
+    db_ops = DatabaseOperations(session)
+    return db_ops.get_folder_files(folder.id, current_user.id)
 
 
 @router.get("/{file_id}",)
@@ -92,32 +121,27 @@ def download_file_by_id(file_id: int, session: SessionDep, current_user: Current
     """
     Endpoint to Download file by id
     """
-    file = session.exec(
-        select(UserFile)
-        .where((UserFile.id == file_id) & (UserFile.owner_id == current_user.id))
-    ).first()
+    db_ops = DatabaseOperations(session)
+    file = db_ops.get_owned_file(file_id, current_user.id)
 
     if not file:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="File not found"
         )
-    file.download_count += 1
-    session.add(file)
-    session.commit()
-    return FileResponse(
+    file_response = FileResponse(
         path=file.filepath,
         filename=file.filename,
         media_type=file.mime_type
     )
+    db_ops.increment_download_count(file.id)
+    return file_response
 
 
 @router.delete("{file_id}", status_code=status.HTTP_200_OK)
 def delete_file(file_id: int, session: SessionDep, current_user: CurrentUserDep):
-    file = session.exec(
-        select(UserFile)
-        .where((UserFile.id == file_id) & (UserFile.owner_id == current_user.id))
-    ).first()
+    db_ops = DatabaseOperations(session)
+    file = db_ops.get_owned_file(file_id, current_user.id)
 
     if not file:
         raise HTTPException(
@@ -129,8 +153,190 @@ def delete_file(file_id: int, session: SessionDep, current_user: CurrentUserDep)
     
     if os.path.exists(filepath):
         os.remove(filepath)
+    shutil.rmtree(get_versions_dir(file), ignore_errors=True)
     
-    db_ops = DatabaseOperations(session)
     db_ops.delete_file(file)
     return {"message": "File deleted Successfully"}
 
+
+@router.get("/{file_id}/signature", response_model=FileSignature)
+def get_file_signature(file_id: int, session: SessionDep, current_user: CurrentUserDep,
+                       block_size: Annotated[int, Query(ge=MIN_BLOCK_SIZE, le=MAX_BLOCK_SIZE)] = DEFAULT_BLOCK_SIZE):
+    """
+    Endpoint to return the block signature of the current version, the first
+    step of a delta update
+    """
+    db_ops = DatabaseOperations(session)
+    file = db_ops.get_owned_file(file_id, current_user.id)
+
+    if not file or not os.path.exists(file.filepath):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="File not found"
+        )
+
+    version = db_ops.get_current_version(file.id)
+    versions_dir = get_versions_dir(file)
+    cache_path = os.path.join(versions_dir, f"signature-v{version}-{block_size}.json")
+
+    # Signatures only change with the version, so repeated syncs skip rehashing.
+    # A cache that is missing or unreadable is simply rebuilt.
+    try:
+        with open(cache_path) as cache:
+            return FileSignature.model_validate_json(cache.read())
+    except (OSError, ValueError):
+        pass
+
+    with open(file.filepath, 'rb') as buffer:
+        blocks = compute_signature(buffer, block_size)
+    signature = FileSignature(
+        file_id=file.id,
+        version=version,
+        filesize=os.path.getsize(file.filepath),
+        block_size=block_size,
+        blocks=blocks
+    )
+
+    # Concurrent requests for the same signature each write their own file
+    os.makedirs(versions_dir, exist_ok=True)
+    temp_path = f"{cache_path}.{secrets.token_hex(4)}.tmp"
+    with open(temp_path, 'w') as cache:
+        cache.write(signature.model_dump_json())
+    os.replace(temp_path, cache_path)
+    return signature
+
+
+@router.put("/{file_id}/delta")
+def update_file_delta(file_id: int, session: SessionDep, current_user: CurrentUserDep,
+                      base_version: int = Form(...), block_size: int = Form(...), instructions: str = Form(...),
+                      sha256: Optional[str] = Form(None), data: Optional[UploadFile] = File(None)):
+    """
+    Endpoint to update a file from a delta against the signature of `base_version`.
+    The previous content is kept as a version of the same file.
+    """
+    ensure_accepting_uploads()
+
+    db_ops = DatabaseOperations(session)
+    # Lock the row so concurrent updates of the same file apply one at a time
+    file = db_ops.get_owned_file(file_id, current_user.id, for_update=True)
+
+    if not file or not os.path.exists(file.filepath):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="File not found"
+        )
+
+    current_version = db_ops.get_current_version(file.id)
+    if base_version != current_version:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"File has changed, current version is {current_version}"
+        )
+
+    if not MIN_BLOCK_SIZE <= block_size <= MAX_BLOCK_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Block size must be between {MIN_BLOCK_SIZE} and {MAX_BLOCK_SIZE}"
+        )
+
+    try:
+        parsed_instructions = json.loads(instructions)
+    except ValueError:
+        parsed_instructions = None
+    if not isinstance(parsed_instructions, list):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Instructions must be a JSON list"
+        )
+
+    filepath = file.filepath
+    versions_dir = get_versions_dir(file)
+    os.makedirs(versions_dir, exist_ok=True)
+    incoming_path = os.path.join(versions_dir, f".incoming-{secrets.token_hex(8)}")
+    base_size = os.path.getsize(filepath)
+    literals = data.file if data else io.BytesIO()
+    literals_size = literals.seek(0, os.SEEK_END)
+    literals.seek(0)
+    max_size = int(MAX_DELTA_GROWTH * (base_size + literals_size))
+
+    try:
+        with open(filepath, 'rb') as base, open(incoming_path, 'wb') as out:
+            new_size, digest = apply_delta(
+                base, base_size, block_size, parsed_instructions, literals, out, max_size
+            )
+        if sha256 and sha256.lower() != digest:
+            raise DeltaError("Rebuilt file does not match the expected sha256")
+    except DeltaError as e:
+        os.remove(incoming_path)
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except BaseException:
+        if os.path.exists(incoming_path):
+            os.remove(incoming_path)
+        raise
+
+    # Archive the old content by renaming it, so only the new version is written
+    archived_path = os.path.join(versions_dir, f"v{current_version}-{secrets.token_hex(4)}")
+    os.replace(filepath, archived_path)
+    os.replace(incoming_path, filepath)
+
+    try:
+        stale_paths = db_ops.update_file_content(
+            file, current_version, archived_path, base_size, new_size, MAX_FILE_VERSIONS
+        )
+    except HTTPException:
+        os.replace(archived_path, filepath)
+        raise
+
+    for path in stale_paths:
+        if os.path.exists(path):
+            os.remove(path)
+    for name in os.listdir(versions_dir):
+        if name.startswith(f"signature-v{current_version}-"):
+            os.remove(os.path.join(versions_dir, name))
+
+    return {
+        "message": "File updated successfully",
+        "version": current_version + 1,
+        "filesize": new_size,
+        "sha256": digest
+    }
+
+
+@router.get("/{file_id}/versions", response_model=List[FileVersionRead])
+def get_file_versions(file_id: int, session: SessionDep, current_user: CurrentUserDep):
+    """
+    Endpoint to list the archived versions of a file, newest first
+    """
+    db_ops = DatabaseOperations(session)
+    file = db_ops.get_owned_file(file_id, current_user.id)
+
+    if not file:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="File not found"
+        )
+    return db_ops.get_file_versions(file.id)
+
+
+@router.get("/{file_id}/versions/{version}")
+def download_file_version(file_id: int, version: int, session: SessionDep, current_user: CurrentUserDep):
+    """
+    Endpoint to download an archived version of a file
+    """
+    db_ops = DatabaseOperations(session)
+    file = db_ops.get_owned_file(file_id, current_user.id)
+    file_version = db_ops.get_file_version(file_id, version) if file else None
+
+    if not file_version or not os.path.exists(file_version.filepath):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Version not found"
+        )
+    return FileResponse(
+        path=file_version.filepath,
+        filename=file.filename,
+        media_type=file.mime_type
+    )
@@ -29,7 +29,8 @@ def create_folder(folder_data: FolderCreate, session: SessionDep, current_user:
 
 @router.get("/", response_model=List[FolderRead])
 def get_folder(session: SessionDep, current_user: CurrentUserDep):
-    return current_user.folders
+    db_ops = DatabaseOperations(session)
+    return db_ops.get_user_folders(current_user.id)
 
 
 @router.patch("/{folder_id}", response_model=FolderRead)
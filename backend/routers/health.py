@@ -0,0 +1,27 @@
+from fastapi import APIRouter, status, HTTPException
+from lifecycle import state
+
+
+router = APIRouter()
+
+
+@router.get("/live")
+def liveness():
+    """
+    Endpoint for liveness probes, answers as long as the process is serving
+    """
+    return {"status": "alive"}
+
+
+@router.get("/ready")
+def readiness():
+    """
+    Endpoint for readiness probes, fails while starting up or draining.
+    Never touches the database.
+    """
+    if state.draining or not state.ready:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="draining" if state.draining else "starting"
+        )
+    return {"status": "ready", "startup_seconds": state.startup_seconds}
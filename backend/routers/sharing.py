@@ -73,21 +73,16 @@ def get_file_by_token(token: str, session: SessionDep):
     """
     Endpoint to return file through access link
     """
-    file_permission = session.exec(
-        select(FilePermission)
-        .where(FilePermission.share_token == token)
-    ).first()
+    db_ops = DatabaseOperations(session)
+    shared = db_ops.get_shared_file(token)
 
-    if not file_permission:
+    if not shared:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Invalid link"
         )
     
-    file = session.exec(
-            select(UserFile)
-            .where(UserFile.id == file_permission.file_id)
-        ).first()
+    file_permission, file = shared
     
     if not os.path.exists(file.filepath):
         raise HTTPException(status_code=404, detail="File missing on server")
@@ -97,14 +92,14 @@ def get_file_by_token(token: str, session: SessionDep):
         filename=file.filename,
         media_type=file.mime_type
     )
-    file.download_count += 1
-    session.add(file)
-    session.commit()
-    if file_permission.access_type == 'anyone_with_link':
+    # Read the permission before the commit expires it
+    access_type, expiry_time = file_permission.access_type, file_permission.expiry_time
+    db_ops.increment_download_count(file.id)
+    if access_type == 'anyone_with_link':
         return file_response
     
-    elif file_permission.access_type == 'timed_access':
-        if file_permission.expiry_time < datetime.now(timezone.utc):
+    elif access_type == 'timed_access':
+        if expiry_time < datetime.now(timezone.utc):
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Link already expired"
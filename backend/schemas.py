@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional, Tuple
 from datetime import datetime
 
 class TokenData(BaseModel):
@@ -46,3 +46,41 @@ class FileAccess(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+class ChangeRead(BaseModel):
+    seq: int
+    entity_type: str
+    entity_id: int
+    action: str
+    name: Optional[str] = None
+    parent_id: Optional[int] = None
+    access_type: Optional[str] = None
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class ChangeFeed(BaseModel):
+    changes: List[ChangeRead]
+    cursor: int
+    has_more: bool
+
+
+
+class FileVersionRead(BaseModel):
+    version: int
+    filesize: int
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class FileSignature(BaseModel):
+    file_id: int
+    version: int
+    filesize: int
+    block_size: int
+    blocks: List[Tuple[int, str]]
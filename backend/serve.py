@@ -0,0 +1,66 @@
+"""
+Multi-process entry point.
+
+Runs database migrations once in this parent process, then starts uvicorn
+workers that skip them. Each worker logs its cold-start time and reports it
+on GET /health/ready.
+
+Workers start draining as soon as they receive their exit signal: readiness
+fails, new uploads get a 503 and change streams close, while uvicorn waits up
+to SHUTDOWN_DRAIN_SECONDS for in-flight requests to finish. Plain
+`uvicorn main:app` only learns about shutdown after connections have closed,
+so use this entry point in deployments that rely on draining.
+
+Usage:
+    python serve.py --workers 4 --port 8000
+"""
+import argparse
+import os
+import time
+
+import uvicorn
+from uvicorn.supervisors import Multiprocess
+
+import lifecycle
+
+
+class DrainingServer(uvicorn.Server):
+    """uvicorn server that flags the app as draining when asked to exit"""
+
+    def handle_exit(self, sig, frame) -> None:
+        lifecycle.begin_draining()
+        super().handle_exit(sig, frame)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the API with multiple worker processes")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)))
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    from database import run_migrations_once
+    run_migrations_once()
+    print(f"Migrations finished in {time.perf_counter() - started:.3f}s")
+
+    # Inherited by the workers so their lifespan skips schema creation
+    os.environ["DB_INIT_DONE"] = "1"
+
+    config = uvicorn.Config(
+        "main:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        timeout_graceful_shutdown=int(os.getenv("SHUTDOWN_DRAIN_SECONDS", "30")),
+    )
+    server = DrainingServer(config=config)
+    # Same dispatch as uvicorn.run, but with our server class in every worker
+    if config.workers > 1:
+        Multiprocess(config, target=server.run, sockets=[config.bind_socket()]).run()
+    else:
+        server.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,16 @@
-from passlib.context import CryptContext
+from functools import lru_cache
 
 
-pwd_context = CryptContext(schemes=['bcrypt'])
+@lru_cache(maxsize=None)
+def get_pwd_context():
+    # passlib and bcrypt are only needed for register and login, so load them on first use
+    from passlib.context import CryptContext
+    return CryptContext(schemes=['bcrypt'])
 
 
 def get_password_hash(plain_password) -> str:
-    return pwd_context.hash(plain_password)
+    return get_pwd_context().hash(plain_password)
 
 
 def verify_password(plain_password, hashed_password) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
\ No newline at end of file
+    return get_pwd_context().verify(plain_password, hashed_password)